@@ -2,24 +2,29 @@
 Unified Agent Classes
 Agent 1: SOP Assistant
 Agent 2: Human Capital Assistant
+
+Heavy dependencies (langchain_openai, FAISS, numpy) are imported where they
+are first used so that importing this module stays cheap at API start-up.
 """
-import os
 from config import settings
 
 # rest of imports
 
-import re
+import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Optional, Tuple
 
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.chains import RetrievalQA
-from langchain_core.prompts import PromptTemplate
 
+if TYPE_CHECKING:
+    import httpx
+    from langchain_community.vectorstores import FAISS
+    from langchain_openai import AzureChatOpenAI
+    from embeddings import CachedAzureEmbeddings
 
 from prompts import (
     SOP_SYSTEM_PROMPT,
@@ -29,6 +34,168 @@ from prompts import (
 )
 
 
+class QueryBatcher:
+    """Coalesces concurrent questions into one embedding call and one FAISS search"""
+    
+    def __init__(self, vectorstore: "FAISS", embeddings: "CachedAzureEmbeddings", k: int):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.k = k
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        # One search at a time: each already uses FAISS_NUM_THREADS OpenMP threads,
+        # and GPU indexes are not safe to search from several threads at once
+        self._search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-search")
+    
+    async def search(self, question: str) -> List[Tuple[Document, float]]:
+        """Queue a question and wait for its share of the batched search"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, future))
+        
+        if len(self._pending) >= settings.QUERY_BATCH_MAX_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                settings.QUERY_BATCH_WINDOW_MS / 1000,
+                self._flush
+            )
+        
+        return await future
+    
+    def _flush(self):
+        """Dispatch every pending question as a single batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Embed and search a batch, then fan results back to the callers"""
+        questions = [question for question, _ in batch]
+        
+        try:
+            vectors = await self.embeddings.aembed_queries(questions)
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._search_executor, self._search_vectors, vectors
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    def _search_vectors(self, vectors: List[List[float]]) -> List[List[Tuple[Document, float]]]:
+        """Run one FAISS search over the stacked query matrix"""
+        from faiss_store import search_vectors
+        
+        scores, indices = search_vectors(self.vectorstore, vectors, self.k)
+        
+        docstore = self.vectorstore.docstore
+        id_map = self.vectorstore.index_to_docstore_id
+        
+        return [
+            [
+                (docstore.search(id_map[i]), float(score))
+                for score, i in zip(row_scores, row_indices)
+                if i != -1
+            ]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+
+
+@lru_cache(maxsize=1)
+def _http_clients() -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+    """Keep-alive HTTP clients shared by every Azure OpenAI client in the process"""
+    import httpx
+    
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS
+    )
+    return httpx.Client(limits=limits), httpx.AsyncClient(limits=limits)
+
+
+@lru_cache(maxsize=1)
+def get_llm() -> "AzureChatOpenAI":
+    """Chat model shared by both agents"""
+    from langchain_openai import AzureChatOpenAI
+    
+    http_client, http_async_client = _http_clients()
+    return AzureChatOpenAI(
+        azure_deployment=settings.AZURE_CHAT_DEPLOYMENT,
+        openai_api_version=settings.AZURE_OPENAI_API_VERSION,
+        azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+        api_key=settings.AZURE_OPENAI_KEY,
+        temperature=settings.TEMPERATURE,
+        max_tokens=settings.MAX_TOKENS,
+        timeout=60,
+        max_retries=2,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> "CachedAzureEmbeddings":
+    """Query embeddings shared by both agents (query vectors are cached in-process)"""
+    from embeddings import CachedAzureEmbeddings
+    
+    http_client, http_async_client = _http_clients()
+    return CachedAzureEmbeddings(
+        model=settings.AZURE_EMBEDDING_DEPLOYMENT,
+        azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+        api_key=settings.AZURE_OPENAI_KEY,
+        api_version=settings.AZURE_OPENAI_API_VERSION,
+        chunk_size=settings.EMBEDDING_CHUNK_SIZE,
+        max_retries=settings.EMBEDDING_MAX_RETRIES,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _render_context(doc_keys: Tuple[Tuple[str, str, str], ...]) -> str:
+    """Render (document_id, title, content) tuples as prompt context"""
+    buffer = io.StringIO()
+    
+    for i, (doc_id, title, content) in enumerate(doc_keys, 1):
+        if i > 1:
+            buffer.write("\n")
+        buffer.write(f"\n[Source {i}: {doc_id}]\n{title}\n\n{content}\n\n---")
+    
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=1024)
+def _render_sources(source_keys: Tuple[Tuple[str, str, str, str], ...]) -> Tuple[Dict, ...]:
+    """Deduplicate (document_id, title, doc_type, filename) tuples by document ID"""
+    sources = []
+    seen = set()
+    
+    for doc_id, title, doc_type, filename in source_keys:
+        if doc_id not in seen:
+            sources.append({
+                'document_id': doc_id,
+                'title': title,
+                'doc_type': doc_type,
+                'filename': filename
+            })
+            seen.add(doc_id)
+    
+    return tuple(sources)
+
+
 class BaseAgent:
     """Base class for both agents"""
     
@@ -36,76 +203,55 @@ class BaseAgent:
         """Initialize base agent components"""
         self.agent_type = agent_type
         
-        # Initialize LLM
-        self.llm = AzureChatOpenAI(
-            azure_deployment=settings.AZURE_CHAT_DEPLOYMENT,
-            openai_api_version=settings.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
-            api_key=settings.AZURE_OPENAI_KEY,
-            temperature=settings.TEMPERATURE,
-            max_tokens=settings.MAX_TOKENS,
-            timeout=60,
-            max_retries=2,
-        )
-        
-        # Initialize embeddings
-        self.embeddings = AzureOpenAIEmbeddings(
-            model=settings.AZURE_EMBEDDING_DEPLOYMENT,
-            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
-            api_key=settings.AZURE_OPENAI_KEY,
-            api_version=settings.AZURE_OPENAI_API_VERSION,
-            chunk_size=16
-        )
+        # Both agents share one LLM and one embeddings client (and their connection pools)
+        self.llm = get_llm()
+        self.embeddings = get_embeddings()
     
     def _format_context(self, docs: List[Document]) -> str:
         """Format documents as context"""
-        context_parts = []
-        
-        for i, doc in enumerate(docs, 1):
-            doc_id = doc.metadata.get('document_id', 'Unknown')
-            title = doc.metadata.get('title', 'Unknown')
-            
-            context_parts.append(f"""
-[Source {i}: {doc_id}]
-{title}
-
-{doc.page_content}
-
----""")
-        
-        return "\n".join(context_parts)
+        return _render_context(tuple(
+            (
+                doc.metadata.get('document_id', 'Unknown'),
+                doc.metadata.get('title', 'Unknown'),
+                doc.page_content
+            )
+            for doc in docs
+        ))
     
     def _extract_sources(self, docs: List[Document]) -> List[Dict]:
         """Extract source metadata"""
-        sources = []
-        seen = set()
-        
-        for doc in docs:
-            doc_id = doc.metadata.get('document_id', 'Unknown')
-            if doc_id not in seen:
-                sources.append({
-                    'document_id': doc_id,
-                    'title': doc.metadata.get('title', 'Unknown'),
-                    'doc_type': doc.metadata.get('doc_type', 'Document'),
-                    'filename': doc.metadata.get('filename', 'Unknown')
-                })
-                seen.add(doc_id)
+        sources = _render_sources(tuple(
+            (
+                doc.metadata.get('document_id', 'Unknown'),
+                doc.metadata.get('title', 'Unknown'),
+                doc.metadata.get('doc_type', 'Document'),
+                doc.metadata.get('filename', 'Unknown')
+            )
+            for doc in docs
+        ))
         
-        return sources
+        # Copy so callers never mutate the cached entries
+        return [dict(source) for source in sources]
 
 
 class SOPAgent(BaseAgent):
     """Agent 1: SOP and Work Procedure Assistant"""
     
+    # Built once and reused by every request
+    _system_message = SystemMessage(content=SOP_SYSTEM_PROMPT)
+    
     def __init__(self):
         """Initialize SOP Agent"""
         super().__init__("SOP")
         print("Initializing SOP Agent...")
         self.vectorstore = self._load_vectorstore()
+        self._batcher = QueryBatcher(self.vectorstore, self.embeddings, settings.SOP_FETCH_K)
         print("SOP Agent initialized\n")
     
-    def _load_vectorstore(self) -> FAISS:
+    def _load_vectorstore(self) -> "FAISS":
         """Load SOP vector store"""
+        from faiss_store import load_vectorstore, prepare_for_search
+        
         vectorstore_path = Path(settings.SOP_VECTORSTORE_PATH)
         
         if not vectorstore_path.exists():
@@ -114,11 +260,9 @@ class SOPAgent(BaseAgent):
                 f"Please run: python ingest_sop.py"
             )
         
-        return FAISS.load_local(
-            str(vectorstore_path),
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
+        vectorstore = load_vectorstore(str(vectorstore_path), self.embeddings)
+        prepare_for_search(vectorstore)
+        return vectorstore
     
     def query(self, question: str, verbose: bool = False) -> Dict:
         """Answer SOP-related questions"""
@@ -130,61 +274,130 @@ class SOPAgent(BaseAgent):
         # Retrieve relevant documents
         docs_with_scores = self.vectorstore.similarity_search_with_score(
             question,
-            k=settings.SOP_TOP_K
+            k=settings.SOP_FETCH_K
         )
         
         if verbose:
             print(f"Found {len(docs_with_scores)} relevant SOP chunks\n")
         
         if not docs_with_scores:
-            return {
-                "answer": f"No relevant SOP information found for: {question}",
-                "sources": [],
-                "chunks": 0
-            }
+            return self._empty_result(question)
         
         # Format context and generate answer
-        docs = [doc for doc, score in docs_with_scores]
+        docs = self._select_chunks(docs_with_scores)
         context = self._format_context(docs)
         answer = self._generate_answer(question, context)
-        sources = self._extract_sources(docs)
         
+        return self._build_result(answer, docs)
+    
+    async def aquery(self, question: str) -> Dict:
+        """Answer SOP-related questions without blocking the event loop"""
+        # Concurrent questions share one embedding request and one FAISS search
+        docs_with_scores = await self._batcher.search(question)
+        
+        if not docs_with_scores:
+            return self._empty_result(question)
+        
+        docs = self._select_chunks(docs_with_scores)
+        context = self._format_context(docs)
+        answer = await self._agenerate_answer(question, context)
+        
+        return self._build_result(answer, docs)
+    
+    async def astream(self, question: str) -> AsyncIterator[Dict]:
+        """Stream an SOP answer as token events, then a final sources event"""
+        docs_with_scores = await self._batcher.search(question)
+        
+        if not docs_with_scores:
+            result = self._empty_result(question)
+            yield {"token": result["answer"]}
+            yield {"sources": result["sources"], "chunks": result["chunks"]}
+            return
+        
+        docs = self._select_chunks(docs_with_scores)
+        context = self._format_context(docs)
+        
+        async for chunk in self.llm.astream(self._build_messages(question, context)):
+            if chunk.content:
+                yield {"token": chunk.content}
+        
+        yield {"sources": self._extract_sources(docs), "chunks": len(docs)}
+    
+    def _select_chunks(self, docs_with_scores: List[Tuple[Document, float]]) -> List[Document]:
+        """Pick SOP_TOP_K chunks, preferring one per document before repeating a document"""
+        best_per_doc = []
+        remainder = []
+        seen = set()
+        
+        # Results arrive best-first, so the first chunk seen per document is its best
+        for doc, score in docs_with_scores:
+            doc_id = doc.metadata.get('document_id', doc.metadata.get('source'))
+            if doc_id in seen:
+                remainder.append(doc)
+            else:
+                seen.add(doc_id)
+                best_per_doc.append(doc)
+        
+        return (best_per_doc + remainder)[:settings.SOP_TOP_K]
+    
+    def _empty_result(self, question: str) -> Dict:
+        """Response used when retrieval finds nothing"""
+        return {
+            "answer": f"No relevant SOP information found for: {question}",
+            "sources": [],
+            "chunks": 0
+        }
+    
+    def _build_result(self, answer: str, docs: List[Document]) -> Dict:
+        """Assemble the answer payload"""
         return {
             "answer": answer,
-            "sources": sources,
+            "sources": self._extract_sources(docs),
             "chunks": len(docs)
         }
     
-    def _generate_answer(self, question: str, context: str) -> str:
-        """Generate SOP answer using LLM"""
+    def _build_messages(self, question: str, context: str) -> List:
+        """Build chat messages for the SOP prompt"""
         prompt = SOP_RESPONSE_TEMPLATE.format(
             context=context,
             query=question
         )
         
-        messages = [
-            SystemMessage(content=SOP_SYSTEM_PROMPT),
+        return [
+            self._system_message,
             HumanMessage(content=prompt)
         ]
-        
-        response = self.llm.invoke(messages)
+    
+    def _generate_answer(self, question: str, context: str) -> str:
+        """Generate SOP answer using LLM"""
+        response = self.llm.invoke(self._build_messages(question, context))
+        return response.content
+    
+    async def _agenerate_answer(self, question: str, context: str) -> str:
+        """Generate SOP answer using the async LLM client"""
+        response = await self.llm.ainvoke(self._build_messages(question, context))
         return response.content
 
 
 class HCAgent(BaseAgent):
     """Agent 2: Human Capital Assistant"""
     
+    # Built once and reused by every request
+    _system_message = SystemMessage(content=HC_SYSTEM_PROMPT)
+    
     def __init__(self, vectorstore_path: str = None):
         """Initialize HC Agent"""
         super().__init__("HC")
         print("Initializing Human Capital Agent...")
         self.vectorstore_path = vectorstore_path or settings.HC_VECTORSTORE_PATH
         self.vectorstore = None
-        self.qa_chain = None
+        self._batcher = None
         print("Human Capital Agent initialized\n")
     
     def load_vectorstore(self):
         """Load HC vector store"""
+        from faiss_store import load_vectorstore, prepare_for_search
+        
         vectorstore_path = Path(self.vectorstore_path)
         
         if not vectorstore_path.exists():
@@ -193,41 +406,17 @@ class HCAgent(BaseAgent):
                 f"Please upload and process HR documents first"
             )
         
-        self.vectorstore = FAISS.load_local(
-            str(vectorstore_path),
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
-        
-        # Create retriever
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": settings.HC_TOP_K}
-        )
-    
-    def create_qa_chain(self):
-        """Create RAG chain for HC queries"""
-        PROMPT = PromptTemplate(
-            template=HC_RESPONSE_TEMPLATE,
-            input_variables=["context", "question"]
-        )
-        
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.retriever,
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": PROMPT}
-        )
+        self.vectorstore = load_vectorstore(str(vectorstore_path), self.embeddings)
+        prepare_for_search(self.vectorstore)
+        self._batcher = QueryBatcher(self.vectorstore, self.embeddings, settings.HC_TOP_K)
     
     def initialize(self):
         """Initialize complete HC system"""
         self.load_vectorstore()
-        self.create_qa_chain()
     
     def query(self, question: str, verbose: bool = False) -> Dict:
         """Answer HC-related questions"""
-        if not self.qa_chain:
+        if not self.vectorstore:
             raise ValueError("HC Agent not initialized. Call initialize() first.")
         
         if verbose:
@@ -235,8 +424,55 @@ class HCAgent(BaseAgent):
             print(f"[HC Agent] Question: {question}")
             print(f"{'='*60}\n")
         
-        result = self.qa_chain.invoke({"query": question})
+        docs = self.vectorstore.similarity_search(question, k=settings.HC_TOP_K)
+        context = self._format_context(docs)
+        response = self.llm.invoke(self._build_messages(question, context))
+        
+        return self._build_result(response.content, docs)
+    
+    async def aquery(self, question: str) -> Dict:
+        """Answer HC-related questions without blocking the event loop"""
+        if not self.vectorstore:
+            raise ValueError("HC Agent not initialized. Call initialize() first.")
+        
+        # Concurrent questions share one embedding request and one FAISS search
+        docs_with_scores = await self._batcher.search(question)
+        docs = [doc for doc, score in docs_with_scores]
+        context = self._format_context(docs)
+        response = await self.llm.ainvoke(self._build_messages(question, context))
+        
+        return self._build_result(response.content, docs)
+    
+    async def astream(self, question: str) -> AsyncIterator[Dict]:
+        """Stream an HC answer as token events, then a final sources event"""
+        if not self.vectorstore:
+            raise ValueError("HC Agent not initialized. Call initialize() first.")
+        
+        docs_with_scores = await self._batcher.search(question)
+        docs = [doc for doc, score in docs_with_scores]
+        context = self._format_context(docs)
+        
+        async for chunk in self.llm.astream(self._build_messages(question, context)):
+            if chunk.content:
+                yield {"token": chunk.content}
+        
+        result = self._build_result("", docs)
+        yield {"sources": result["sources"], "chunks": result["chunks"]}
+    
+    def _build_messages(self, question: str, context: str) -> List:
+        """Build chat messages for the HC prompt"""
+        prompt = HC_RESPONSE_TEMPLATE.format(
+            context=context,
+            question=question
+        )
         
+        return [
+            self._system_message,
+            HumanMessage(content=prompt)
+        ]
+    
+    def _build_result(self, answer: str, docs: List[Document]) -> Dict:
+        """Assemble the answer payload (one source entry per chunk)"""
         sources = [
             {
                 "document_id": doc.metadata.get('document_id', 'Unknown'),
@@ -245,11 +481,11 @@ class HCAgent(BaseAgent):
                 "filename": doc.metadata.get('filename', 'Unknown'),
                 "content": doc.page_content
             }
-            for doc in result["source_documents"]
+            for doc in docs
         ]
         
         return {
-            "answer": result["result"],
+            "answer": answer,
             "sources": sources,
             "chunks": len(sources)
         }
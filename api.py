@@ -6,18 +6,23 @@ Provides REST API endpoints for both agents:
 """
 
 import os
-import shutil
-from typing import Optional, List, Dict
+import json
+import time
+from functools import lru_cache
+from typing import AsyncIterator, Optional, List, Dict, Union
 from dotenv import load_dotenv
 
+import aiofiles
+import anyio
+
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from agents import SOPAgent, HCAgent
-from ingest import DocumentIngestor
 import os
-from config import settings
+from config import get_settings
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -49,6 +54,55 @@ app.add_middleware(
 sop_agent: Optional[SOPAgent] = None
 hc_agent: Optional[HCAgent] = None
 
+
+# Serializes HC ingestion + agent reload (anyio.Lock binds to the running loop lazily)
+_hc_lock = anyio.Lock()
+
+# Upload read size for streaming files to disk
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+# Seconds an index-existence check is reused for /status (liveness probes)
+INDEX_STATUS_TTL_S = 10
+
+
+@lru_cache(maxsize=4)
+def _index_exists(path: str, epoch: int) -> bool:
+    """os.path.exists memoized per path for one TTL epoch"""
+    return os.path.exists(path)
+
+
+def _index_exists_cached(path: str) -> bool:
+    """Index existence check that hits the filesystem at most once per TTL"""
+    return _index_exists(path, int(time.monotonic() // INDEX_STATUS_TTL_S))
+
+
+def _ingest_hc_document(file_path: str) -> int:
+    """Chunk, embed and index an uploaded HR document (blocking)"""
+    # Ingestion dependencies are only loaded on the first upload
+    from ingest import DocumentIngestor
+    
+    ingestor = DocumentIngestor(agent_type="HC")
+    return ingestor.process_document(file_path, get_settings().HC_VECTORSTORE_PATH)
+
+
+def _create_hc_agent() -> HCAgent:
+    """Create and initialize the HC agent (blocks while the index loads)"""
+    agent = HCAgent()
+    agent.initialize()
+    return agent
+
+
+async def _stream_events(agent: Union[SOPAgent, HCAgent], question: str, label: str) -> AsyncIterator[str]:
+    """Relay agent stream events as server-sent events"""
+    try:
+        async for event in agent.astream(question):
+            yield f"data: {json.dumps(event)}\n\n"
+        print(f"[{label}] ✅ Answer streamed\n")
+    except Exception as e:
+        print(f"[{label}] ❌ Error: {str(e)}")
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+
 # Pydantic models
 class Question(BaseModel):
     question: str
@@ -112,8 +166,8 @@ async def startup_event():
     
     # Try to initialize SOP Agent
     try:
-        if os.path.exists(settings.SOP_VECTORSTORE_PATH):
-            sop_agent = SOPAgent()
+        if os.path.exists(get_settings().SOP_VECTORSTORE_PATH):
+            sop_agent = await anyio.to_thread.run_sync(SOPAgent)
             print("✅ SOP Agent: Ready")
         else:
             print("⚠️ SOP Agent: No index found (run: python ingest_unified.py sop)")
@@ -122,9 +176,8 @@ async def startup_event():
     
     # Try to initialize HC Agent (optional, initialized on demand)
     try:
-        if os.path.exists(settings.HC_VECTORSTORE_PATH):
-            hc_agent = HCAgent()
-            hc_agent.initialize()
+        if os.path.exists(get_settings().HC_VECTORSTORE_PATH):
+            hc_agent = await anyio.to_thread.run_sync(_create_hc_agent)
             print("✅ HC Agent: Ready")
         else:
             print("⚠️ HC Agent: No index found (will initialize after document upload)")
@@ -152,7 +205,7 @@ async def ask_sop_question(question: Question):
     
     try:
         print(f"\n[SOP Agent] ❓ Question: {question.question}")
-        result = sop_agent.query(question.question)
+        result = await sop_agent.aquery(question.question)
         print(f"[SOP Agent] ✅ Answer generated\n")
         
         return AnswerResponse(
@@ -167,6 +220,26 @@ async def ask_sop_question(question: Question):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/sop/stream")
+async def stream_sop_question(question: Question):
+    """
+    Agent 1: SOP Assistant Streaming Endpoint
+    Streams the answer as server-sent events: {"token": ...} per chunk,
+    then {"sources": [...], "chunks": n}
+    """
+    if not sop_agent:
+        raise HTTPException(
+            status_code=400,
+            detail="SOP Agent not initialized. Please run: python ingest_unified.py sop"
+        )
+    
+    print(f"\n[SOP Agent] ❓ Question (stream): {question.question}")
+    return StreamingResponse(
+        _stream_events(sop_agent, question.question, "SOP Agent"),
+        media_type="text/event-stream"
+    )
+
+
 # ==================== HC Agent Endpoints ====================
 
 @app.post("/hc/upload", response_model=StatusResponse)
@@ -193,25 +266,29 @@ async def upload_hc_document(file: UploadFile = File(...)):
     
     try:
         # Save uploaded file
-        upload_dir = settings.HC_UPLOAD_DIR
+        upload_dir = get_settings().HC_UPLOAD_DIR
         os.makedirs(upload_dir, exist_ok=True)
         file_path = os.path.join(upload_dir, file.filename)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"\n[HC Agent] 📄 Processing document: {file.filename}")
-        
-        # Process document and create index
-        ingestor = DocumentIngestor(agent_type="HC")
-        chunks_created = ingestor.process_document(file_path, settings.HC_VECTORSTORE_PATH)
-        
-        print(f"[HC Agent] ✅ Created {chunks_created} chunks")
-        
-        # Initialize HC agent
-        print("[HC Agent] 🔧 Initializing agent...")
-        hc_agent = HCAgent()
-        hc_agent.initialize()
+        # One upload at a time: each rebuilds the same index and reloads the agent,
+        # so overlapping uploads would race on the files and double-load FAISS
+        async with _hc_lock:
+            # Stream to disk in 1 MiB chunks without blocking the event loop
+            async with aiofiles.open(file_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    await buffer.write(chunk)
+            
+            print(f"\n[HC Agent] 📄 Processing document: {file.filename}")
+            
+            # Process document and create index in a worker thread
+            chunks_created = await anyio.to_thread.run_sync(_ingest_hc_document, file_path)
+            
+            print(f"[HC Agent] ✅ Created {chunks_created} chunks")
+            _index_exists.cache_clear()
+            
+            # Initialize HC agent
+            print("[HC Agent] 🔧 Initializing agent...")
+            hc_agent = await anyio.to_thread.run_sync(_create_hc_agent)
         
         print("[HC Agent] ✅ Ready!\n")
         
@@ -242,7 +319,7 @@ async def ask_hc_question(question: Question):
     
     try:
         print(f"\n[HC Agent] ❓ Question: {question.question}")
-        result = hc_agent.query(question.question)
+        result = await hc_agent.aquery(question.question)
         print(f"[HC Agent] ✅ Answer generated\n")
         
         return AnswerResponse(
@@ -257,6 +334,26 @@ async def ask_hc_question(question: Question):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/hc/stream")
+async def stream_hc_question(question: Question):
+    """
+    Agent 2: HC Assistant Streaming Endpoint
+    Streams the answer as server-sent events: {"token": ...} per chunk,
+    then {"sources": [...], "chunks": n}
+    """
+    if not hc_agent:
+        raise HTTPException(
+            status_code=400,
+            detail="HC Agent not initialized. Please upload a document first."
+        )
+    
+    print(f"\n[HC Agent] ❓ Question (stream): {question.question}")
+    return StreamingResponse(
+        _stream_events(hc_agent, question.question, "HC Agent"),
+        media_type="text/event-stream"
+    )
+
+
 # ==================== System Endpoints ====================
 
 @app.get("/status", response_model=SystemStatus)
@@ -267,8 +364,8 @@ async def get_status():
     return SystemStatus(
         sop_agent_ready=sop_agent is not None,
         hc_agent_ready=hc_agent is not None,
-        sop_index_exists=os.path.exists(settings.SOP_VECTORSTORE_PATH),
-        hc_index_exists=os.path.exists(settings.HC_VECTORSTORE_PATH),
+        sop_index_exists=_index_exists_cached(get_settings().SOP_VECTORSTORE_PATH),
+        hc_index_exists=_index_exists_cached(get_settings().HC_VECTORSTORE_PATH),
         env_loaded=env_loaded,
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "Not set"),
         embedding_model=os.getenv("AZURE_EMBEDDING_DEPLOYMENT", "Not set"),
@@ -289,7 +386,8 @@ async def root():
                 "persona": "Filman Galuh Purnawidjaya (AVP Kepatuhan)",
                 "description": "Answers questions about SOPs and Work Procedures",
                 "endpoints": {
-                    "POST /sop/ask": "Ask SOP questions"
+                    "POST /sop/ask": "Ask SOP questions",
+                    "POST /sop/stream": "Ask SOP questions (streamed)"
                 }
             },
             {
@@ -298,7 +396,8 @@ async def root():
                 "description": "Answers questions about HR policies and regulations",
                 "endpoints": {
                     "POST /hc/upload": "Upload HR document",
-                    "POST /hc/ask": "Ask HC questions"
+                    "POST /hc/ask": "Ask HC questions",
+                    "POST /hc/stream": "Ask HC questions (streamed)"
                 }
             }
         ],
@@ -3,30 +3,44 @@ Unified Configuration for Both Agents
 SOP Assistant + Human Capital Assistant
 """
 import os
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 
+# slots=True needs Python 3.10+; fall back to a plain frozen dataclass on 3.9
+_DATACLASS_OPTIONS = {"frozen": True}
+if sys.version_info >= (3, 10):
+    _DATACLASS_OPTIONS["slots"] = True
+
+
+def _env(name: str, default: str):
+    """Field default read from the environment when Settings is instantiated"""
+    return field(default_factory=lambda: os.getenv(name, default))
+
+
+def _env_int(name: str, default: int):
+    """Integer field default read from the environment"""
+    return field(default_factory=lambda: int(os.getenv(name, str(default))))
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class Settings:
-    """Unified settings for both agents"""
+    """Unified settings for both agents (immutable; use get_settings())"""
     
     # ==================== Azure OpenAI Configuration ====================
-    AZURE_OPENAI_ENDPOINT: str = os.getenv("AZURE_OPENAI_ENDPOINT", "")
-    AZURE_OPENAI_KEY: str = os.getenv("AZURE_OPENAI_KEY", "")
-    AZURE_OPENAI_API_VERSION: str = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01")
+    AZURE_OPENAI_ENDPOINT: str = _env("AZURE_OPENAI_ENDPOINT", "")
+    AZURE_OPENAI_KEY: str = _env("AZURE_OPENAI_KEY", "")
+    AZURE_OPENAI_API_VERSION: str = _env("AZURE_OPENAI_API_VERSION", "2024-02-01")
     
     # Deployment names
-    AZURE_EMBEDDING_DEPLOYMENT: str = os.getenv("AZURE_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
-    AZURE_CHAT_DEPLOYMENT: str = os.getenv("AZURE_CHAT_DEPLOYMENT", "gpt-4.1-mini")
-    
-    # For backward compatibility with Krutika's code
-    AZURE_OPENAI_DEPLOYMENT_NAME: str = AZURE_CHAT_DEPLOYMENT
-    AZURE_OPENAI_EMBEDDING_DEPLOYMENT: str = AZURE_EMBEDDING_DEPLOYMENT
-    AZURE_OPENAI_API_KEY: str = AZURE_OPENAI_KEY
+    AZURE_EMBEDDING_DEPLOYMENT: str = _env("AZURE_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+    AZURE_CHAT_DEPLOYMENT: str = _env("AZURE_CHAT_DEPLOYMENT", "gpt-4.1-mini")
     
     # ==================== Agent 1: SOP Assistant ====================
     # Paths for SOP documents
@@ -34,9 +48,10 @@ class Settings:
     SOP_VECTORSTORE_PATH: str = "data/vectorstore/sop_faiss_index"
     
     # SOP Agent settings
-    SOP_CHUNK_SIZE: int = 800
-    SOP_CHUNK_OVERLAP: int = 120
+    SOP_CHUNK_SIZE: int = 200  # Tokens (cl100k_base)
+    SOP_CHUNK_OVERLAP: int = 30  # Tokens
     SOP_TOP_K: int = 4
+    SOP_FETCH_K: int = 12  # Over-fetched candidates, diversified down to SOP_TOP_K documents
     
     # ==================== Agent 2: Human Capital Assistant ====================
     # Paths for HR documents
@@ -45,43 +60,103 @@ class Settings:
     HC_UPLOAD_DIR: str = "uploads/hc"
     
     # HC Agent settings
-    HC_CHUNK_SIZE: int = 800
-    HC_CHUNK_OVERLAP: int = 120
+    HC_CHUNK_SIZE: int = 200  # Tokens (cl100k_base)
+    HC_CHUNK_OVERLAP: int = 30  # Tokens
     HC_TOP_K: int = 4
     
     # ==================== LLM Configuration ====================
     TEMPERATURE: float = 0.0
     MAX_TOKENS: int = 1000
     
+    # Shared HTTP connection pool for Azure OpenAI clients
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    
+    # ==================== Embedding Configuration ====================
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048  # Cached question vectors per process
+    EMBEDDING_CHUNK_SIZE: int = 1000  # Inputs per embeddings request (Azure limit: 2048)
+    EMBEDDING_MAX_RETRIES: int = 6  # Retries with exponential backoff on 429s
+    INGEST_BATCH_SIZE: int = 512  # Texts per embeddings REST request during ingestion (Azure limit: 2048)
+    INGEST_CONCURRENCY: int = 8  # Embedding requests (and pooled connections) in flight during ingestion
+    SPLITTER_ENCODING: str = "cl100k_base"  # Tokenizer used to measure chunk length
+    EMBEDDING_CACHE_PATH: str = "data/vectorstore/embedding_cache.sqlite3"  # Chunk vectors keyed by SHA-256
+    METADATA_CACHE_PATH: str = "data/vectorstore/.metadata_cache.json"  # SOP header metadata keyed by path/mtime/size
+    
+    # ==================== Query Batching ====================
+    QUERY_BATCH_WINDOW_MS: int = 50  # How long to collect concurrent questions
+    QUERY_BATCH_MAX_SIZE: int = 32  # Flush early once this many are queued
+    
+    # ==================== FAISS Index Configuration ====================
+    FAISS_INDEX_TYPE: str = "auto"  # "auto", "flat", "hnsw" or "ivfpq"
+    FAISS_IVFPQ_MIN_VECTORS: int = 10_000  # "auto" switches from HNSW to IVF-PQ above this
+    FAISS_METRIC: str = "ip"  # "ip" (inner product on normalized vectors) or "l2"
+    FAISS_SCALAR_QUANTIZER: str = "fp16"  # Flat/HNSW vector storage: "none", "fp16" or "8bit"
+    FAISS_TRAIN_SAMPLE: int = 10_000  # Vectors used to train quantizers (IVF gets >= 39 per list)
+    FAISS_IVF_NLIST: int = 0  # IVF-PQ inverted lists (0 = ~4*sqrt(N))
+    FAISS_PQ_M: int = 64  # IVF-PQ sub-quantizers (bytes per vector)
+    FAISS_HNSW_M: int = 32  # HNSW graph neighbours per node
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200  # HNSW build-time search breadth
+    FAISS_EF_SEARCH: int = _env_int("FAISS_EF_SEARCH", 64)  # HNSW query-time search breadth
+    FAISS_NPROBE: int = _env_int("FAISS_NPROBE", 16)  # IVF lists scanned per query
+    FAISS_NUM_THREADS: int = _env_int("FAISS_NUM_THREADS", 4)  # OpenMP threads per worker (0 = FAISS default)
+    FAISS_MMAP: bool = field(
+        default_factory=lambda: os.getenv("FAISS_MMAP", "true").lower() == "true"
+    )  # Memory-map IVF inverted lists on load (HNSW/flat indexes are always read into RAM)
+    USE_GPU_FAISS: bool = field(
+        default_factory=lambda: os.getenv("USE_GPU_FAISS", "false").lower() == "true"
+    )  # Needs faiss-gpu; only flat (no scalar quantizer) and IVF-PQ indexes run on the GPU
+    
     # ==================== General Settings ====================
-    CHUNK_SIZE: int = 800  # Default
-    CHUNK_OVERLAP: int = 120  # Default
+    CHUNK_SIZE: int = 200  # Default (tokens)
+    CHUNK_OVERLAP: int = 30  # Default (tokens)
     TOP_K: int = 4  # Default
     
-    # Backward compatibility
-    VECTORSTORE_PATH: str = SOP_VECTORSTORE_PATH
-    DOCUMENTS_PATH: Path = SOP_DOCUMENTS_PATH
+    # ==================== Backward Compatibility ====================
+    # For backward compatibility with Krutika's code
+    @property
+    def AZURE_OPENAI_DEPLOYMENT_NAME(self) -> str:
+        return self.AZURE_CHAT_DEPLOYMENT
+    
+    @property
+    def AZURE_OPENAI_EMBEDDING_DEPLOYMENT(self) -> str:
+        return self.AZURE_EMBEDDING_DEPLOYMENT
+    
+    @property
+    def AZURE_OPENAI_API_KEY(self) -> str:
+        return self.AZURE_OPENAI_KEY
     
-    @classmethod
-    def validate(cls):
+    @property
+    def VECTORSTORE_PATH(self) -> str:
+        return self.SOP_VECTORSTORE_PATH
+    
+    @property
+    def DOCUMENTS_PATH(self) -> Path:
+        return self.SOP_DOCUMENTS_PATH
+    
+    def validate(self):
         """Validate required settings"""
-        if not cls.AZURE_OPENAI_ENDPOINT:
+        if not self.AZURE_OPENAI_ENDPOINT:
             raise ValueError("AZURE_OPENAI_ENDPOINT not set in .env file")
-        if not cls.AZURE_OPENAI_KEY:
+        if not self.AZURE_OPENAI_KEY:
             raise ValueError("AZURE_OPENAI_KEY not set in .env file")
-        if not cls.AZURE_EMBEDDING_DEPLOYMENT:
+        if not self.AZURE_EMBEDDING_DEPLOYMENT:
             raise ValueError("AZURE_EMBEDDING_DEPLOYMENT not set in .env file")
-        if not cls.AZURE_CHAT_DEPLOYMENT:
+        if not self.AZURE_CHAT_DEPLOYMENT:
             raise ValueError("AZURE_CHAT_DEPLOYMENT not set in .env file")
     
-    @classmethod
-    def create_directories(cls):
+    def create_directories(self):
         """Create necessary directories"""
-        cls.SOP_DOCUMENTS_PATH.mkdir(parents=True, exist_ok=True)
-        cls.HC_DOCUMENTS_PATH.mkdir(parents=True, exist_ok=True)
-        Path(cls.SOP_VECTORSTORE_PATH).parent.mkdir(parents=True, exist_ok=True)
-        Path(cls.HC_VECTORSTORE_PATH).parent.mkdir(parents=True, exist_ok=True)
-        Path(cls.HC_UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+        self.SOP_DOCUMENTS_PATH.mkdir(parents=True, exist_ok=True)
+        self.HC_DOCUMENTS_PATH.mkdir(parents=True, exist_ok=True)
+        Path(self.SOP_VECTORSTORE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        Path(self.HC_VECTORSTORE_PATH).parent.mkdir(parents=True, exist_ok=True)
+        Path(self.HC_UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Process-wide settings singleton"""
+    return Settings()
 
 
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Azure Embeddings Adapters
+Query-side embeddings with an in-process cache for repeated questions,
+and a direct REST batch client for ingestion
+"""
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List
+
+import httpx
+from langchain_openai import AzureOpenAIEmbeddings
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from config import settings
+
+
+class CachedAzureEmbeddings(AzureOpenAIEmbeddings):
+    """Azure embeddings that reuse query vectors for repeated questions"""
+    
+    _query_cache: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _query_cache_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    
+    def _cache_key(self, text: str) -> str:
+        """Key cached vectors by deployment and question hash"""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model}:{digest}"
+    
+    def _cache_get(self, key: str):
+        """Return a cached vector, marking it recently used"""
+        with self._query_cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                return list(vector)
+        return None
+    
+    def _cache_put(self, key: str, vector: List[float]):
+        """Store a vector, evicting the least recently used ones"""
+        with self._query_cache_lock:
+            self._query_cache[key] = tuple(vector)
+            while len(self._query_cache) > settings.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, skipping the Azure call for cached questions"""
+        key = self._cache_key(text)
+        vector = self._cache_get(key)
+        
+        if vector is None:
+            vector = super().embed_query(text)
+            self._cache_put(key, vector)
+        
+        return vector
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async variant of embed_query sharing the same cache"""
+        vectors = await self.aembed_queries([text])
+        return vectors[0]
+    
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one request, reusing cached vectors"""
+        keys = [self._cache_key(text) for text in texts]
+        vectors = [self._cache_get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if missing:
+            fresh = await self.aembed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self._cache_put(keys[i], vector)
+        
+        return vectors
+
+
+async def aembed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts for ingestion, INGEST_CONCURRENCY batch requests at a time over one connection pool"""
+    url = (
+        f"{settings.AZURE_OPENAI_ENDPOINT.rstrip('/')}/openai/deployments/"
+        f"{settings.AZURE_EMBEDDING_DEPLOYMENT}/embeddings"
+    )
+    semaphore = asyncio.Semaphore(settings.INGEST_CONCURRENCY)
+    batch_size = settings.INGEST_BATCH_SIZE
+    limits = httpx.Limits(
+        max_connections=settings.INGEST_CONCURRENCY,
+        max_keepalive_connections=settings.INGEST_CONCURRENCY
+    )
+    
+    async with httpx.AsyncClient(
+        headers={"api-key": settings.AZURE_OPENAI_KEY},
+        params={"api-version": settings.AZURE_OPENAI_API_VERSION},
+        limits=limits,
+        timeout=60
+    ) as client:
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await _post_embeddings(client, url, batch)
+        
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    
+    # gather preserves order, so vectors line up with texts
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+async def _post_embeddings(client: httpx.AsyncClient, url: str, batch: List[str]) -> List[List[float]]:
+    """POST one embeddings request, backing off on throttling (429), server and connection errors"""
+    for attempt in range(settings.EMBEDDING_MAX_RETRIES + 1):
+        last_attempt = attempt == settings.EMBEDDING_MAX_RETRIES
+        
+        try:
+            response = await client.post(url, json={"input": batch})
+        except httpx.TransportError:
+            # Timeouts, dropped connections, DNS/TLS failures
+            if last_attempt:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        
+        retryable = response.status_code == 429 or response.status_code >= 500
+        if not retryable or last_attempt:
+            response.raise_for_status()
+            data = sorted(response.json()["data"], key=lambda item: item["index"])
+            return [item["embedding"] for item in data]
+        
+        await asyncio.sleep(_retry_delay(response, attempt))
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff capped at a minute"""
+    return min(2 ** attempt, 60)
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Delay Azure asks for (retry-after-ms or retry-after seconds), else exponential backoff"""
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(response.headers[header]) * scale
+        except (KeyError, ValueError):
+            continue  # Missing, or an HTTP date we don't parse
+    
+    return _backoff(attempt)
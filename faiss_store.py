@@ -0,0 +1,344 @@
+"""
+FAISS Index Helpers
+Shared by ingestion (index construction) and the agents (query-time tuning)
+"""
+import json
+import math
+import os
+import pickle
+import shutil
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from config import settings
+
+
+# FAISS recommends at least ~39 training points per IVF centroid
+IVF_MIN_POINTS_PER_LIST = 39
+
+# On-disk layout: raw FAISS index plus one JSON line per indexed chunk
+INDEX_FILENAME = "index.faiss"
+DOCS_FILENAME = "docs.jsonl"
+
+# Saves go to versioned subdirectories; CURRENT names the live one
+CURRENT_FILENAME = "CURRENT"
+KEEP_VERSIONS = 2
+
+# GPU resources must outlive the indexes that use them
+_gpu_resources = None
+
+
+def new_index(vectors: np.ndarray, gpu: bool = False) -> faiss.Index:
+    """Create an empty (trained) index for the configured FAISS_INDEX_TYPE
+    
+    With gpu set, HNSW and scalar-quantized flat indexes (no GPU implementation)
+    are replaced by a plain flat index so the build can actually run on the GPU.
+    """
+    dimension = vectors.shape[1]
+    index_type = settings.FAISS_INDEX_TYPE
+    metric = _metric_type()
+    
+    if index_type == "auto":
+        # Compress large corpora with IVF-PQ; HNSW is faster and exact enough below that
+        index_type = "ivfpq" if len(vectors) > settings.FAISS_IVFPQ_MIN_VECTORS else "hnsw"
+    
+    if index_type == "ivfpq":
+        nlist = settings.FAISS_IVF_NLIST or _adaptive_nlist(len(vectors))
+        min_points = nlist * IVF_MIN_POINTS_PER_LIST
+        if len(vectors) >= min_points:
+            index = faiss.index_factory(
+                dimension,
+                f"OPQ{settings.FAISS_PQ_M},IVF{nlist},PQ{settings.FAISS_PQ_M}",
+                metric
+            )
+            index.train(_training_sample(vectors, min_points))
+            return index
+        
+        print(f"Only {len(vectors)} vectors (IVF-PQ needs {min_points}), using HNSW")
+        index_type = "hnsw"
+    
+    qtype = _scalar_quantizer_type()
+    
+    if gpu and (index_type == "hnsw" or qtype is not None):
+        print(f"{index_type} index (quantizer: {settings.FAISS_SCALAR_QUANTIZER}) has no GPU "
+              f"implementation, building an exact flat index for the GPU instead")
+        index_type = "flat"
+        qtype = None
+    
+    if index_type == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dimension, settings.FAISS_HNSW_M, metric)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, qtype, settings.FAISS_HNSW_M, metric)
+        index.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+    elif index_type == "flat":
+        if qtype is None:
+            index = faiss.IndexFlat(dimension, metric)
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, qtype, metric)
+    else:
+        raise ValueError(f"Unsupported FAISS_INDEX_TYPE: {index_type}")
+    
+    # Scalar quantizers learn per-dimension ranges (a no-op for fp16)
+    if not index.is_trained:
+        index.train(_training_sample(vectors))
+    
+    return index
+
+
+def _training_sample(vectors: np.ndarray, min_size: int = 0) -> np.ndarray:
+    """Evenly spaced subset of at most FAISS_TRAIN_SAMPLE vectors (or min_size, if larger)"""
+    size = max(settings.FAISS_TRAIN_SAMPLE, min_size)
+    if len(vectors) <= size:
+        return vectors
+    
+    # Evenly spaced over the whole corpus rather than a prefix, so every document contributes
+    positions = np.linspace(0, len(vectors) - 1, size).astype(np.int64)
+    return np.ascontiguousarray(vectors[positions])
+
+
+def _adaptive_nlist(num_vectors: int) -> int:
+    """~4*sqrt(N) inverted lists, capped so every list gets enough training points"""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // IVF_MIN_POINTS_PER_LIST))
+
+
+def _metric_type() -> int:
+    """Map FAISS_METRIC to a FAISS metric constant"""
+    if settings.FAISS_METRIC == "ip":
+        return faiss.METRIC_INNER_PRODUCT
+    if settings.FAISS_METRIC == "l2":
+        return faiss.METRIC_L2
+    
+    raise ValueError(f"Unsupported FAISS_METRIC: {settings.FAISS_METRIC}")
+
+
+def _scalar_quantizer_type() -> Optional[int]:
+    """Map FAISS_SCALAR_QUANTIZER to a FAISS quantizer type (None = full float32)"""
+    quantizer = settings.FAISS_SCALAR_QUANTIZER
+    
+    if quantizer == "none":
+        return None
+    if quantizer == "fp16":
+        return faiss.ScalarQuantizer.QT_fp16
+    if quantizer == "8bit":
+        return faiss.ScalarQuantizer.QT_8bit
+    
+    raise ValueError(f"Unsupported FAISS_SCALAR_QUANTIZER: {quantizer}")
+
+
+def _is_ivf(index: faiss.Index) -> bool:
+    """True for IVF indexes, including ones wrapped in a pre-transform (OPQ)"""
+    try:
+        faiss.extract_index_ivf(index)
+        return True
+    except RuntimeError:
+        return False
+
+
+def tune_index(index: faiss.Index):
+    """Apply query-time search parameters (efSearch / nprobe) from settings"""
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = settings.FAISS_EF_SEARCH
+    
+    if _is_ivf(index):
+        faiss.extract_index_ivf(index).nprobe = settings.FAISS_NPROBE
+
+
+def to_gpu(index: faiss.Index) -> faiss.Index:
+    """Copy an index to the GPU(s) if one is available, otherwise return it unchanged
+    
+    Only flat indexes without a scalar quantizer (FAISS_INDEX_TYPE=flat with
+    FAISS_SCALAR_QUANTIZER=none) and IVF-PQ indexes have GPU implementations;
+    HNSW and IndexScalarQuantizer stay on the CPU.
+    """
+    global _gpu_resources
+    
+    try:
+        num_gpus = faiss.get_num_gpus()
+        if num_gpus == 0:
+            print("USE_GPU_FAISS is set but no GPU was found, staying on CPU")
+            return index
+        
+        if num_gpus > 1:
+            options = faiss.GpuMultipleClonerOptions()
+            # float32 PQ64 lookup tables (64*256*4 B) exceed GPU shared memory
+            options.useFloat16 = True
+            return faiss.index_cpu_to_all_gpus(index, co=options)
+        
+        options = faiss.GpuClonerOptions()
+        options.useFloat16 = True
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(_gpu_resources, 0, index, options)
+    
+    except (AttributeError, RuntimeError) as e:
+        # CPU-only FAISS wheel, or an index type without a GPU implementation
+        print(f"GPU FAISS unavailable for {type(index).__name__}, staying on CPU: {e}")
+        return index
+
+
+def to_cpu(index: faiss.Index) -> faiss.Index:
+    """Copy a GPU index back to host memory (the on-disk format is CPU-only)"""
+    try:
+        return faiss.index_gpu_to_cpu(index)
+    except (AttributeError, RuntimeError):
+        return index  # CPU-only FAISS wheel, or already a CPU index
+
+
+def use_index_metric(vectorstore: FAISS):
+    """Configure the LangChain wrapper for the metric stored in the index file"""
+    if vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        # Unit-normalized vectors: inner product ranks like L2, minus the subtraction
+        vectorstore._normalize_L2 = True
+        vectorstore.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+
+
+def search_vectors(vectorstore: FAISS, vectors: List[List[float]], k: int):
+    """Search a batch of query vectors, normalizing them for inner-product indexes"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(matrix)
+    
+    return vectorstore.index.search(matrix, k)
+
+
+def prepare_for_search(vectorstore: FAISS):
+    """Tune a freshly loaded vector store and move it to the GPU if enabled"""
+    # Bound OpenMP threads so concurrent searches don't oversubscribe the worker
+    if settings.FAISS_NUM_THREADS > 0:
+        faiss.omp_set_num_threads(settings.FAISS_NUM_THREADS)
+    
+    use_index_metric(vectorstore)
+    tune_index(vectorstore.index)
+    if settings.USE_GPU_FAISS:
+        vectorstore.index = to_gpu(vectorstore.index)
+
+
+def load_vectorstore(folder_path: str, embeddings: Embeddings) -> FAISS:
+    """Load a saved FAISS store, memory-mapping IVF inverted lists when FAISS_MMAP is set"""
+    folder = _current_version(Path(folder_path))
+    
+    # In faiss 1.8 IO_FLAG_MMAP only maps the inverted lists of IVF indexes: those pages
+    # are faulted in on demand and shared across worker processes via the page cache.
+    # HNSW and flat/SQ indexes ignore the flag and are always read fully into RAM.
+    io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if settings.FAISS_MMAP else 0
+    index = faiss.read_index(str(folder / INDEX_FILENAME), io_flags)
+    if settings.FAISS_MMAP and not _is_ivf(index):
+        print(f"{folder.name}: {type(index).__name__} cannot be memory-mapped, loaded into RAM")
+    
+    if (folder / DOCS_FILENAME).exists():
+        docstore, index_to_docstore_id = _read_docs(folder / DOCS_FILENAME)
+    else:
+        # Stores written by FAISS.save_local before the JSONL sidecar
+        with open(folder / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
+    )
+
+
+def _current_version(folder: Path) -> Path:
+    """Directory holding the live index/docs pair (the folder itself for older layouts)"""
+    pointer = folder / CURRENT_FILENAME
+    if pointer.exists():
+        return folder / pointer.read_text(encoding="utf-8").strip()
+    return folder
+
+
+def save_vectorstore(vectorstore: FAISS, folder_path: str):
+    """Write the raw FAISS index plus a JSON-lines docstore (no pickle)"""
+    folder = Path(folder_path)
+    
+    # Each save goes to a fresh version directory, published by atomically replacing
+    # the CURRENT pointer. Loaders therefore always see a matching index/docs pair,
+    # and files a running API has memory-mapped are never truncated underneath it.
+    version = f"v{time.time_ns()}"
+    version_dir = folder / version
+    version_dir.mkdir(parents=True)
+    
+    faiss.write_index(vectorstore.index, str(version_dir / INDEX_FILENAME))
+    
+    # One line per index position, so row i of the index is line i of the file
+    with open(version_dir / DOCS_FILENAME, "w", encoding="utf-8") as f:
+        for position in range(len(vectorstore.index_to_docstore_id)):
+            doc_id = vectorstore.index_to_docstore_id[position]
+            doc = vectorstore.docstore.search(doc_id)
+            f.write(json.dumps(
+                {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False
+            ) + "\n")
+    
+    pointer_tmp = folder / f"{CURRENT_FILENAME}.tmp"
+    pointer_tmp.write_text(version, encoding="utf-8")
+    os.replace(pointer_tmp, folder / CURRENT_FILENAME)
+    
+    _prune_versions(folder)
+
+
+def _prune_versions(folder: Path):
+    """Drop superseded versions, keeping the previous one for workers still loading it"""
+    versions = sorted(path for path in folder.glob("v*") if path.is_dir())
+    for stale in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(stale, ignore_errors=True)
+    
+    # Files from the pre-versioned layout would otherwise go stale next to the pointer
+    for name in (INDEX_FILENAME, DOCS_FILENAME, "index.pkl"):
+        (folder / name).unlink(missing_ok=True)
+
+
+def _read_docs(docs_path: Path) -> Tuple[InMemoryDocstore, Dict[int, str]]:
+    """Rebuild the docstore and position -> id map from a JSON-lines sidecar"""
+    docs = {}
+    index_to_docstore_id = {}
+    
+    with open(docs_path, "r", encoding="utf-8") as f:
+        for position, line in enumerate(f):
+            record = json.loads(line)
+            docs[record["id"]] = Document(page_content=record["page_content"], metadata=record["metadata"])
+            index_to_docstore_id[position] = record["id"]
+    
+    return InMemoryDocstore(docs), index_to_docstore_id
+
+
+def create_vectorstore(
+    texts: List[str],
+    vectors: List[List[float]],
+    metadatas: List[Dict],
+    embeddings: Embeddings,
+    use_gpu: bool = False
+) -> FAISS:
+    """Build a FAISS vector store from precomputed embeddings, adding on the GPU if requested"""
+    matrix = np.asarray(vectors, dtype="float32")
+    if settings.FAISS_METRIC == "ip":
+        faiss.normalize_L2(matrix)
+    index = new_index(matrix, gpu=use_gpu)
+    tune_index(index)
+    if use_gpu:
+        gpu_index = to_gpu(index)
+        if gpu_index is index:
+            print("GPU build unavailable, adding vectors on the CPU")
+        index = gpu_index
+    
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    use_index_metric(vectorstore)
+    vectorstore.add_embeddings(zip(texts, vectors), metadatas=metadatas)
+    
+    return vectorstore
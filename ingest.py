@@ -4,10 +4,16 @@ Supports both SOP and HC document processing
 """
 import os
 import re
-import shutil
+import asyncio
+import hashlib
+import itertools
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
+import numpy as np
 from dotenv import load_dotenv
 from langchain_openai import AzureOpenAIEmbeddings
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
@@ -16,11 +22,130 @@ from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
 from config import settings
+from embeddings import aembed_texts
+from faiss_store import create_vectorstore, load_vectorstore, prepare_for_search, save_vectorstore, to_cpu
 
 
 load_dotenv()
 
 
+# Header fields of SOP documents, matched in a single pass
+_META_RE = re.compile(
+    r'Document ID:\s*(?P<document_id>[\w-]+)'
+    r'|Title:\s*(?P<title>.+)'
+    r'|Version:\s*(?P<version>[\d.]+)'
+)
+
+# SOP section banners: a heading line between two rules of "=" characters
+_SECTION_RE = re.compile(r'^={20,}\n(?P<section>[^\n]+)\n={20,}\n?', re.MULTILINE)
+
+# Headers sit at the top of the document; no need to scan the body
+METADATA_HEADER_SIZE = 2048
+
+# Bump whenever _extract_metadata's rules change (e.g. doc_type mapping) to drop cached metadata
+METADATA_FORMAT_VERSION = 1
+
+
+def load_file(file_path: str) -> List[Document]:
+    """Load a PDF/DOCX file (module-level so process pool workers can run it)"""
+    file_extension = os.path.splitext(file_path)[1].lower()
+    
+    if file_extension == '.pdf':
+        loader = PyPDFLoader(file_path)
+    elif file_extension in ['.docx', '.doc']:
+        loader = Docx2txtLoader(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+    
+    return loader.load()
+
+
+class EmbeddingCache:
+    """Content-addressed sqlite cache of chunk embeddings, so unchanged chunks skip Azure"""
+    
+    def __init__(self, path: str, model: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+    
+    def _key(self, text: str) -> bytes:
+        """SHA-256 of the deployment name and chunk text"""
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+    
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vector per text, or None where missing"""
+        vectors = []
+        for text in texts:
+            row = self.conn.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (self._key(text),)
+            ).fetchone()
+            vectors.append(np.frombuffer(row[0], dtype=np.float32).tolist() if row else None)
+        return vectors
+    
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        """Store freshly computed vectors"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (self._key(text), np.asarray(vector, dtype=np.float32).tobytes())
+                    for text, vector in zip(texts, vectors)
+                ]
+            )
+    
+    def close(self):
+        self.conn.close()
+
+
+class MetadataCache:
+    """JSON sidecar of extracted document metadata, so unchanged files skip the header scan"""
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.fingerprint = self._fingerprint()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        
+        # Entries extracted under different rules are discarded wholesale
+        if isinstance(data, dict) and data.get("fingerprint") == self.fingerprint:
+            self.entries = data.get("entries", {})
+        else:
+            self.entries = {}
+        self.seen = {}
+    
+    @staticmethod
+    def _fingerprint() -> str:
+        """Identifies the extraction rules; regex or header-size edits change it automatically"""
+        rules = f"{METADATA_FORMAT_VERSION}:{METADATA_HEADER_SIZE}:{_META_RE.pattern}"
+        return hashlib.sha256(rules.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def key(file_path: Path, stat: os.stat_result) -> str:
+        """Path plus modification time and size, so any edit invalidates the entry"""
+        return f"{file_path}:{stat.st_mtime_ns}:{stat.st_size}"
+    
+    def get(self, key: str) -> Optional[Dict]:
+        metadata = self.entries.get(key)
+        if metadata is not None:
+            self.seen[key] = metadata
+        return metadata
+    
+    def put(self, key: str, metadata: Dict):
+        self.seen[key] = metadata
+    
+    def save(self):
+        """Write back entries for the files seen this run (stale ones drop out)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": self.seen}, f, indent=2)
+
+
 class DocumentIngestor:
     """Handles document processing for both agents"""
     
@@ -51,13 +176,14 @@ class DocumentIngestor:
             azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
             api_key=settings.AZURE_OPENAI_KEY,
             api_version=settings.AZURE_OPENAI_API_VERSION,
-            chunk_size=16
+            chunk_size=settings.EMBEDDING_CHUNK_SIZE,
+            max_retries=settings.EMBEDDING_MAX_RETRIES
         )
         
         # Initialize text splitter
         if agent_type == "SOP":
+            # Banner sections are split off first (see _split_sections)
             separators = [
-                "\n================================================================================\n",
                 "\n## ",
                 "\n### ",
                 "\n\n",
@@ -68,34 +194,25 @@ class DocumentIngestor:
         else:  # HC
             separators = ["\n\n", "\n", ". ", " ", ""]
         
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        # Measure chunks in embedding-model tokens rather than characters
+        self.text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=settings.SPLITTER_ENCODING,
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
-            length_function=len,
             separators=separators
         )
         
         self.vectorstore = None
     
-    def load_document(self, file_path: str) -> List[Document]:
+    def load_document(self, file_path: str, metadata_cache: Optional[MetadataCache] = None) -> List[Document]:
         """Load document based on file extension"""
         file_extension = os.path.splitext(file_path)[1].lower()
         
-        if file_extension == '.pdf':
-            loader = PyPDFLoader(file_path)
-        elif file_extension in ['.docx', '.doc']:
-            loader = Docx2txtLoader(file_path)
-        elif file_extension == '.md':
+        if file_extension == '.md':
             # For markdown files (SOP documents)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            metadata = self._extract_metadata(content, Path(file_path))
-            return [Document(page_content=content, metadata=metadata)]
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+            return [self._load_markdown(Path(file_path), metadata_cache)]
         
-        documents = loader.load()
-        return documents
+        return load_file(file_path)
     
     def load_documents_from_folder(self) -> List[Document]:
         """Load all documents from the agent's folder"""
@@ -106,37 +223,60 @@ class DocumentIngestor:
             md_files = list(self.documents_path.glob("*.md"))
             print(f"Loading {len(md_files)} SOP documents...")
             
+            metadata_cache = MetadataCache(settings.METADATA_CACHE_PATH)
             for md_file in md_files:
                 try:
-                    with open(md_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    metadata = self._extract_metadata(content, md_file)
-                    doc = Document(page_content=content, metadata=metadata)
-                    documents.append(doc)
+                    documents.extend(self.load_document(str(md_file), metadata_cache))
                     print(f"  ✓ {md_file.name}")
                 except Exception as e:
                     print(f"  ✗ Error loading {md_file.name}: {e}")
+            metadata_cache.save()
         else:
             # Load PDF/DOCX for HC
             file_patterns = ['*.pdf', '*.docx', '*.doc']
-            files = []
-            for pattern in file_patterns:
-                files.extend(list(self.documents_path.glob(pattern)))
+            files = itertools.chain.from_iterable(
+                self.documents_path.glob(pattern) for pattern in file_patterns
+            )
             
-            print(f"Loading {len(files)} HC documents...")
+            print(f"Loading HC documents from {self.documents_path}...")
             
-            for file in files:
-                try:
-                    docs = self.load_document(str(file))
-                    documents.extend(docs)
-                    print(f"  ✓ {file.name}")
-                except Exception as e:
-                    print(f"  ✗ Error loading {file.name}: {e}")
+            # PDF parsing and DOCX unzipping are CPU-bound, so parse files in parallel processes;
+            # each file is submitted as soon as the directory scan yields it
+            with ProcessPoolExecutor() as executor:
+                futures = [(file, executor.submit(load_file, str(file))) for file in files]
+                
+                for file, future in futures:
+                    try:
+                        documents.extend(future.result())
+                        print(f"  ✓ {file.name}")
+                    except Exception as e:
+                        print(f"  ✗ Error loading {file.name}: {e}")
         
         print(f"Loaded {len(documents)} documents\n")
         return documents
     
+    def _load_markdown(self, file_path: Path, metadata_cache: Optional[MetadataCache] = None) -> Document:
+        """Read a markdown file, taking metadata from its header bytes only"""
+        with open(file_path, 'rb') as f:
+            cache_key = MetadataCache.key(file_path, os.fstat(f.fileno())) if metadata_cache is not None else None
+            head = f.read(METADATA_HEADER_SIZE)
+            body = f.read()
+        
+        metadata = metadata_cache.get(cache_key) if metadata_cache is not None else None
+        if metadata is None:
+            # The cut may split a multi-byte character; the header fields are ASCII anyway
+            metadata = self._extract_metadata(head.decode('utf-8', errors='ignore'), file_path)
+            if metadata_cache is not None:
+                metadata_cache.put(cache_key, metadata)
+        metadata = dict(metadata)
+        
+        data = head + body
+        if b'\r' in data:
+            # Match the newline translation of text-mode reads
+            data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        
+        return Document(page_content=data.decode('utf-8'), metadata=metadata)
+    
     def _extract_metadata(self, content: str, file_path: Path) -> Dict:
         """Extract metadata from document"""
         metadata = {
@@ -144,20 +284,11 @@ class DocumentIngestor:
             "filename": file_path.name
         }
         
-        # Extract document ID
-        doc_id_match = re.search(r'Document ID:\s*([\w-]+)', content)
-        if doc_id_match:
-            metadata["document_id"] = doc_id_match.group(1)
-        
-        # Extract title
-        title_match = re.search(r'Title:\s*(.+)', content)
-        if title_match:
-            metadata["title"] = title_match.group(1).strip()
-        
-        # Extract version
-        version_match = re.search(r'Version:\s*([\d.]+)', content)
-        if version_match:
-            metadata["version"] = version_match.group(1)
+        # Extract document ID, title and version (first occurrence of each)
+        for match in _META_RE.finditer(content, 0, METADATA_HEADER_SIZE):
+            field = match.lastgroup
+            if field not in metadata:
+                metadata[field] = match.group(field).strip()
         
         # Set document type
         doc_id = metadata.get("document_id", "")
@@ -172,10 +303,43 @@ class DocumentIngestor:
         
         return metadata
     
+    def _split_sections(self, documents: List[Document]) -> List[Document]:
+        """Split SOP documents at their "=====" banner headings, tagging each part with its section"""
+        sections = []
+        
+        for doc in documents:
+            content = doc.page_content
+            matches = list(_SECTION_RE.finditer(content))
+            
+            # (heading, body start, body end); text before the first banner has no heading
+            parts = [(None, 0, matches[0].start() if matches else len(content))]
+            for k, match in enumerate(matches):
+                end = matches[k + 1].start() if k + 1 < len(matches) else len(content)
+                parts.append((match.group("section").strip(), match.end(), end))
+            
+            for section, start, end in parts:
+                body = content[start:end].strip()
+                if not body:
+                    continue
+                
+                metadata = dict(doc.metadata)
+                if section is not None:
+                    # Keep the heading (without its rules) as the first line of the chunk
+                    body = f"{section}\n{body}"
+                    metadata["section"] = section
+                sections.append(Document(page_content=body, metadata=metadata))
+        
+        return sections
+    
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
         """Split documents into chunks"""
         print(f"Splitting documents into chunks...")
-        print(f"Chunk size: {self.chunk_size} | Overlap: {self.chunk_overlap}")
+        print(f"Chunk size: {self.chunk_size} tokens | Overlap: {self.chunk_overlap} tokens")
+        
+        if self.agent_type == "SOP":
+            # Split at section boundaries first so chunks never straddle two sections;
+            # sections that fit in one chunk are kept whole
+            documents = self._split_sections(documents)
         
         chunks = self.text_splitter.split_documents(documents)
         
@@ -191,13 +355,43 @@ class DocumentIngestor:
         print(f"Creating FAISS vector store...")
         print(f"Embedding {len(chunks)} chunks...")
         
-        self.vectorstore = FAISS.from_documents(
-            documents=chunks,
-            embedding=self.embeddings
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [chunk.metadata for chunk in chunks]
+        
+        vectors = self._embed_with_cache(texts)
+        
+        print(f"Building {settings.FAISS_INDEX_TYPE} index...")
+        self.vectorstore = create_vectorstore(
+            texts,
+            vectors,
+            metadatas,
+            self.embeddings,
+            use_gpu=settings.USE_GPU_FAISS
         )
         
         return self.vectorstore
     
+    def _embed_with_cache(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, calling Azure only for chunks not already in the embedding cache"""
+        cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.AZURE_EMBEDDING_DEPLOYMENT)
+        
+        try:
+            vectors = cache.get_many(texts)
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+            
+            if missing:
+                miss_texts = [texts[i] for i in missing]
+                # Batches are embedded concurrently to overlap Azure round-trips
+                fresh = asyncio.run(aembed_texts(miss_texts))
+                cache.put_many(miss_texts, fresh)
+                for i, vector in zip(missing, fresh):
+                    vectors[i] = vector
+        finally:
+            cache.close()
+        
+        return vectors
+    
     def save_vectorstore(self, save_path: str = None):
         """Save FAISS index to disk"""
         if save_path is None:
@@ -206,7 +400,9 @@ class DocumentIngestor:
         if self.vectorstore:
             # Create directory if doesn't exist
             Path(save_path).parent.mkdir(parents=True, exist_ok=True)
-            self.vectorstore.save_local(save_path)
+            if settings.USE_GPU_FAISS:
+                self.vectorstore.index = to_cpu(self.vectorstore.index)
+            save_vectorstore(self.vectorstore, save_path)
             print(f"Vector store saved to: {save_path}\n")
     
     def load_vectorstore(self, load_path: str = None) -> FAISS:
@@ -214,11 +410,8 @@ class DocumentIngestor:
         if load_path is None:
             load_path = self.vectorstore_path
         
-        self.vectorstore = FAISS.load_local(
-            load_path,
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
+        self.vectorstore = load_vectorstore(load_path, self.embeddings)
+        prepare_for_search(self.vectorstore)
         return self.vectorstore
     
     def process_document(self, file_path: str, save_path: str = None) -> int:
@@ -261,12 +454,6 @@ class DocumentIngestor:
         print("-" * 60)
         chunks = self.chunk_documents(documents)
         
-        # Delete old vector store
-        vectorstore_path = Path(self.vectorstore_path)
-        if vectorstore_path.exists():
-            shutil.rmtree(vectorstore_path)
-            print("🗑️ Deleted old vector store")
-        
         # Create vector store
         print("STEP 3: Creating vector store")
         print("-" * 60)
@@ -6,6 +6,7 @@ Dual-Agent System:
 """
 import streamlit as st
 import requests
+import json
 import time
 import sys
 from pathlib import Path
@@ -52,22 +53,6 @@ st.markdown("""
         transform: translateY(-2px);
         box-shadow: 0 4px 12px rgba(0,0,0,0.15);
     }
-    .chat-message {
-        padding: 1.2rem;
-        border-radius: 0.8rem;
-        margin-bottom: 1rem;
-    }
-    .user-message {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        margin-left: 20%;
-    }
-    .assistant-message {
-        background: #f1f5f9;
-        color: #1e293b;
-        margin-right: 20%;
-        border-left: 4px solid #3b82f6;
-    }
     .source-box {
         background-color: #f0f2f6;
         padding: 1rem;
@@ -113,6 +98,7 @@ AGENT_CONFIGS = {
             "What are the differential pressure requirements?",
         ],
         "endpoint": "/sop/ask",
+        "stream_endpoint": "/sop/stream",
         "upload_endpoint": None
     },
     "Human Capital Assistant": {
@@ -132,10 +118,26 @@ AGENT_CONFIGS = {
             "What are the working hours?",
         ],
         "endpoint": "/hc/ask",
+        "stream_endpoint": "/hc/stream",
         "upload_endpoint": "/hc/upload"
     }
 }
 
+# Streaming responses
+def stream_answer(response, result: dict):
+    """Yield answer tokens from the API's server-sent events; the final event lands in result"""
+    for line in response.iter_lines():
+        if not line.startswith(b"data: "):
+            continue
+        
+        event = json.loads(line[len(b"data: "):])
+        if "token" in event:
+            yield event["token"]
+        elif "error" in event:
+            raise RuntimeError(event["error"])
+        else:
+            result.update(event)
+
 # Initialize session state
 if 'current_agent' not in st.session_state:
     st.session_state.current_agent = "SOP Assistant"
@@ -147,9 +149,14 @@ if 'api_status' not in st.session_state:
     st.session_state.api_status = None
 
 # Check API status
-try:
+@st.cache_data(ttl=30)
+def get_api_status():
+    """Fetch backend status (memoized so reruns don't each hit the API)"""
     status_response = requests.get(f"{API_URL}/status", timeout=3)
-    st.session_state.api_status = status_response.json()
+    return status_response.json()
+
+try:
+    st.session_state.api_status = get_api_status()
     api_ready = True
 except Exception as e:
     st.error("⚠️ **Backend API is not running**")
@@ -174,8 +181,9 @@ with col2:
         st.session_state.current_agent = "Human Capital Assistant"
         st.rerun()
 
-# Current agent info
+# Current agent info (the selection only changes via st.rerun, so look these up once per run)
 current_config = AGENT_CONFIGS[st.session_state.current_agent]
+current_history = st.session_state.chat_histories[st.session_state.current_agent]
 st.markdown(f"""
 <div style='background: {current_config["gradient"]}; padding: 1.5rem; border-radius: 10px; color: white; margin: 1rem 0;'>
     <div style='font-size: 1.5rem; font-weight: 600; margin-bottom: 0.5rem;'>
@@ -221,6 +229,7 @@ with st.sidebar:
                         if response.status_code == 200:
                             result = response.json()
                             st.success(f"✅ Ready! {result.get('chunks_created', 0)} chunks created")
+                            get_api_status.clear()  # Pick up the newly ready HC agent
                             time.sleep(1.5)
                             st.rerun()
                         else:
@@ -273,7 +282,6 @@ with st.sidebar:
                 st.info("📋 Upload document to start")
         
         # Statistics
-        current_history = st.session_state.chat_histories[st.session_state.current_agent]
         st.metric("Questions (Current)", len([m for m in current_history if m["role"] == "user"]))
         
         total_questions = sum(len([m for m in hist if m["role"] == "user"]) 
@@ -283,26 +291,15 @@ with st.sidebar:
 # Main chat area
 st.markdown("---")
 
-# Get current chat history
-current_history = st.session_state.chat_histories[st.session_state.current_agent]
-
-# Display chat history
+# Display chat history (native chat elements; colors come from .streamlit/config.toml)
 if current_history:
     for msg in current_history:
         if msg["role"] == "user":
-            st.markdown(f"""
-                <div class="chat-message user-message">
-                    <div style="font-weight: 600; margin-bottom: 0.5rem;">👤 You</div>
-                    <div>{msg["content"]}</div>
-                </div>
-            """, unsafe_allow_html=True)
+            with st.chat_message("user", avatar="👤"):
+                st.markdown(msg["content"])
         else:
-            st.markdown(f"""
-                <div class="chat-message assistant-message">
-                    <div style="font-weight: 600; margin-bottom: 0.5rem;">{current_config["icon"]} {st.session_state.current_agent}</div>
-                    <div>{msg["content"]}</div>
-                </div>
-            """, unsafe_allow_html=True)
+            with st.chat_message("assistant", avatar=current_config["icon"]):
+                st.markdown(msg["content"])
             
             # Show sources
             if "sources" in msg and msg["sources"]:
@@ -348,6 +345,8 @@ if user_input or prompt_input:
         "role": "user",
         "content": actual_input
     })
+    with st.chat_message("user", avatar="👤"):
+        st.markdown(actual_input)
     
     # Check if agent is ready
     if current_config["key"] == "sop":
@@ -369,21 +368,25 @@ if user_input or prompt_input:
         })
         st.rerun()
     
-    # Get AI response
-    with st.spinner(f"🤔 {current_config['persona']} is thinking..."):
-        try:
+    # Get AI response, rendering tokens as they arrive
+    try:
+        with st.spinner(f"🤔 {current_config['persona']} is thinking..."):
             response = requests.post(
-                f"{API_URL}{current_config['endpoint']}",
+                f"{API_URL}{current_config['stream_endpoint']}",
                 json={"question": actual_input},
-                timeout=30
+                timeout=30,
+                stream=True
             )
-            
+        
+        with response:
             if response.status_code == 200:
-                result = response.json()
+                result = {}
+                with st.chat_message("assistant", avatar=current_config["icon"]):
+                    answer = st.write_stream(stream_answer(response, result))
                 
                 current_history.append({
                     "role": "assistant",
-                    "content": result.get("answer", "No answer received"),
+                    "content": answer or "No answer received",
                     "sources": result.get("sources", [])
                 })
             else:
@@ -393,13 +396,20 @@ if user_input or prompt_input:
                     "content": f"❌ Error: {error_msg}",
                     "sources": []
                 })
-        
-        except Exception as e:
-            current_history.append({
-                "role": "assistant",
-                "content": f"❌ Connection error: {str(e)}",
-                "sources": []
-            })
+    
+    except RuntimeError as e:
+        # Error reported by the agent mid-stream
+        current_history.append({
+            "role": "assistant",
+            "content": f"❌ Error: {str(e)}",
+            "sources": []
+        })
+    except Exception as e:
+        current_history.append({
+            "role": "assistant",
+            "content": f"❌ Connection error: {str(e)}",
+            "sources": []
+        })
     
     st.rerun()
 